@@ -1,4 +1,6 @@
-import os, datetime, asyncio
+import os, datetime, asyncio, contextlib, functools, pickle, signal, time
+# Marcado antes dos imports pesados (discord, supabase) para medir o start completo
+INICIO = time.perf_counter()
 from typing import Optional
 import discord
 from discord import app_commands
@@ -17,8 +19,11 @@ PIX_NAME = os.getenv('PIX_NAME')
 ADMIN_ROLE_ID = int(os.getenv('ADMIN_ROLE_ID'))
 LOG_CHANNEL_ID = int(os.getenv('LOG_CHANNEL_ID'))
 CART_CATEGORY_ID = int(os.getenv('CART_CATEGORY_ID'))
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', 'snapshot.pkl')
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '5'))
 
 MENSAGEM_POS_CONFIRMACAO = "Para receber seu produto, abra um ticket e mande o comprovante e nome."
+SNAPSHOT_VERSAO = 2
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
@@ -27,6 +32,56 @@ intents.message_content = False
 bot = commands.Bot(command_prefix='!', intents=intents)
 tree = bot.tree
 
+# Estado em memória salvo no snapshot ao desligar e restaurado no próximo start
+catalogo = {}
+pedidos_em_criacao = {}
+pedidos_interrompidos = []
+tarefas_ativas = set()
+tarefas_fundo = set()
+encerrando = False
+tarefa_encerramento = None
+tarefa_reconciliacao = None
+primeira_interacao = None
+
+def rastrear(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        global primeira_interacao
+        if encerrando:
+            interaction = next(a for a in args if isinstance(a, discord.Interaction))
+            return await interaction.response.send_message("Bot reiniciando, tente novamente em instantes.", ephemeral=True)
+        task = asyncio.current_task()
+        tarefas_ativas.add(task)
+        try:
+            resultado = await func(*args, **kwargs)
+        finally:
+            tarefas_ativas.discard(task)
+        if primeira_interacao is None:
+            primeira_interacao = time.perf_counter() - INICIO
+            print(f"⏱️ Primeira interação atendida {primeira_interacao:.2f}s após o start")
+        return resultado
+    return wrapper
+
+@contextlib.contextmanager
+def pedido_em_criacao(txid, **dados):
+    # Sem finally puro: pedidos cancelados pelo encerrar precisam continuar no dict para irem ao snapshot
+    etapa = pedidos_em_criacao[txid] = {"txid": txid, "thread_id": None, "pix_enviado": False, "log_enviado": False, **dados}
+    cancelado = False
+    try:
+        yield etapa
+    except asyncio.CancelledError:
+        cancelado = True
+        raise
+    finally:
+        if not cancelado:
+            pedidos_em_criacao.pop(txid, None)
+
+def em_fundo(coro):
+    task = asyncio.create_task(coro)
+    tarefas_fundo.add(task)
+    task.add_done_callback(tarefas_fundo.discard)
+    return task
+
 def is_admin(interaction):
     return any(role.id == ADMIN_ROLE_ID for role in interaction.user.roles)
 
@@ -72,6 +127,7 @@ class ProdutoView(View):
 class SelecionarVariacaoButton(Button):
     def __init__(self, produto_id):
         super().__init__(label="🛒 Selecionar Variação", style=discord.ButtonStyle.primary, custom_id=f"var_{produto_id}")
+    @rastrear
     async def callback(self, interaction):
         vars = supabase.table("product_variations").select("*").eq("product_id", self.produto_id).execute().data
         if not vars:
@@ -79,6 +135,7 @@ class SelecionarVariacaoButton(Button):
             return
         options = [discord.SelectOption(label=f"{v['nome']} - R$ {v['preco']:.2f}", value=str(v['id'])) for v in vars]
         select = Select(placeholder="Escolha...", options=options)
+        @rastrear
         async def select_callback(si):
             vid = int(si.data['values'][0])
             var = next(v for v in vars if v['id'] == vid)
@@ -97,29 +154,35 @@ class SelecionarVariacaoButton(Button):
         if not cat:
             await interaction.followup.send("Erro categoria.", ephemeral=True)
             return
-        thread = await cat.create_thread(name=f"pedido-{interaction.user.name[:20]}-{produto_id}", type=discord.ChannelType.private_thread)
-        await thread.add_user(interaction.user)
-        supabase.table("orders").insert({
-            "user_id": str(interaction.user.id),
-            "product_id": produto_id,
-            "variation_id": variacao['id'],
-            "amount": valor,
-            "status": "pending",
-            "payment_id": txid,
-            "thread_id": thread.id,
-            "cargo_entregue": False
-        }).execute()
-        embed = discord.Embed(title="🛒 Pedido", description=f"{prod['nome']} - {variacao['nome']}\nR$ {valor:.2f}", color=discord.Color.from_str(prod['cor_embed']))
-        embed.add_field(name="Pix", value=f"```{pix}```", inline=False)
-        await thread.send(content=interaction.user.mention, embed=embed)
-        log = bot.get_channel(LOG_CHANNEL_ID)
-        if log:
-            await log.send(embed=discord.Embed(title="🆕 Pedido", description=f"{interaction.user.mention}\n{prod['nome']} - {variacao['nome']}\nR$ {valor:.2f}", color=discord.Color.blue(), timestamp=datetime.datetime.utcnow()))
-        await interaction.followup.send(f"✅ Pedido criado: {thread.mention}", ephemeral=True)
+        desc = f"{prod['nome']} - {variacao['nome']}\nR$ {valor:.2f}"
+        with pedido_em_criacao(txid, user_id=str(interaction.user.id), product_id=produto_id, amount=valor, descricao=desc, cor=prod['cor_embed']) as etapa:
+            thread = await cat.create_thread(name=f"pedido-{interaction.user.name[:20]}-{produto_id}", type=discord.ChannelType.private_thread)
+            etapa["thread_id"] = thread.id
+            await thread.add_user(interaction.user)
+            supabase.table("orders").insert({
+                "user_id": str(interaction.user.id),
+                "product_id": produto_id,
+                "variation_id": variacao['id'],
+                "amount": valor,
+                "status": "pending",
+                "payment_id": txid,
+                "thread_id": thread.id,
+                "cargo_entregue": False
+            }).execute()
+            embed = discord.Embed(title="🛒 Pedido", description=desc, color=discord.Color.from_str(prod['cor_embed']))
+            embed.add_field(name="Pix", value=f"```{pix}```", inline=False)
+            await thread.send(content=interaction.user.mention, embed=embed)
+            etapa["pix_enviado"] = True
+            log = bot.get_channel(LOG_CHANNEL_ID)
+            if log:
+                await log.send(embed=discord.Embed(title="🆕 Pedido", description=f"{interaction.user.mention}\n{desc}", color=discord.Color.blue(), timestamp=datetime.datetime.utcnow()))
+            etapa["log_enviado"] = True
+            await interaction.followup.send(f"✅ Pedido criado: {thread.mention}", ephemeral=True)
 
 class ComprarSemVariacaoButton(Button):
     def __init__(self, produto_id):
         super().__init__(label="💳 Comprar", style=discord.ButtonStyle.success, custom_id=f"buy_{produto_id}")
+    @rastrear
     async def callback(self, interaction):
         prod = supabase.table("products").select("*").eq("id", self.produto_id).execute().data[0]
         if not prod:
@@ -133,28 +196,34 @@ class ComprarSemVariacaoButton(Button):
         if not cat:
             await interaction.followup.send("Erro categoria.", ephemeral=True)
             return
-        thread = await cat.create_thread(name=f"pedido-{interaction.user.name[:20]}-{self.produto_id}", type=discord.ChannelType.private_thread)
-        await thread.add_user(interaction.user)
-        supabase.table("orders").insert({
-            "user_id": str(interaction.user.id),
-            "product_id": self.produto_id,
-            "variation_id": None,
-            "amount": valor,
-            "status": "pending",
-            "payment_id": txid,
-            "thread_id": thread.id,
-            "cargo_entregue": False
-        }).execute()
-        embed = discord.Embed(title="🛒 Pedido", description=f"{prod['nome']}\nR$ {valor:.2f}", color=discord.Color.from_str(prod['cor_embed']))
-        embed.add_field(name="Pix", value=f"```{pix}```", inline=False)
-        await thread.send(content=interaction.user.mention, embed=embed)
-        log = bot.get_channel(LOG_CHANNEL_ID)
-        if log:
-            await log.send(embed=discord.Embed(title="🆕 Pedido", description=f"{interaction.user.mention}\n{prod['nome']}\nR$ {valor:.2f}", color=discord.Color.blue(), timestamp=datetime.datetime.utcnow()))
-        await interaction.followup.send(f"✅ Pedido criado: {thread.mention}", ephemeral=True)
+        desc = f"{prod['nome']}\nR$ {valor:.2f}"
+        with pedido_em_criacao(txid, user_id=str(interaction.user.id), product_id=self.produto_id, amount=valor, descricao=desc, cor=prod['cor_embed']) as etapa:
+            thread = await cat.create_thread(name=f"pedido-{interaction.user.name[:20]}-{self.produto_id}", type=discord.ChannelType.private_thread)
+            etapa["thread_id"] = thread.id
+            await thread.add_user(interaction.user)
+            supabase.table("orders").insert({
+                "user_id": str(interaction.user.id),
+                "product_id": self.produto_id,
+                "variation_id": None,
+                "amount": valor,
+                "status": "pending",
+                "payment_id": txid,
+                "thread_id": thread.id,
+                "cargo_entregue": False
+            }).execute()
+            embed = discord.Embed(title="🛒 Pedido", description=desc, color=discord.Color.from_str(prod['cor_embed']))
+            embed.add_field(name="Pix", value=f"```{pix}```", inline=False)
+            await thread.send(content=interaction.user.mention, embed=embed)
+            etapa["pix_enviado"] = True
+            log = bot.get_channel(LOG_CHANNEL_ID)
+            if log:
+                await log.send(embed=discord.Embed(title="🆕 Pedido", description=f"{interaction.user.mention}\n{desc}", color=discord.Color.blue(), timestamp=datetime.datetime.utcnow()))
+            etapa["log_enviado"] = True
+            await interaction.followup.send(f"✅ Pedido criado: {thread.mention}", ephemeral=True)
 
 @tree.command(name="criar_produto", description="ADM")
 @app_commands.describe(nome="Nome", descricao="Desc", preco="0 se tiver variação", cargo_id="ID do cargo", thumbnail_url="URL", banner_url="URL")
+@rastrear
 async def criar_produto(interaction, nome: str, descricao: str, preco: float, cargo_id: str, thumbnail_url: str, banner_url: str):
     if not is_admin(interaction):
         return await interaction.response.send_message("Permissão negada.", ephemeral=True)
@@ -174,10 +243,12 @@ async def criar_produto(interaction, nome: str, descricao: str, preco: float, ca
     view = ProdutoView(pid, preco == 0)
     msg = await interaction.channel.send(embed=embed, view=view)
     supabase.table("products").update({"mensagem_id": msg.id}).eq("id", pid).execute()
+    catalogo[pid] = {"mensagem_id": msg.id, "canal_id": interaction.channel_id, "tem_var": preco == 0}
     await interaction.response.send_message(f"✅ ID: {pid}", ephemeral=True)
 
 @tree.command(name="adicionar_variacao", description="ADM")
 @app_commands.describe(produto_id="ID", nome="Nome", preco="Preço", cargo_id="Opcional")
+@rastrear
 async def adicionar_variacao(interaction, produto_id: int, nome: str, preco: float, cargo_id: Optional[str] = None):
     if not is_admin(interaction):
         return await interaction.response.send_message("Permissão negada.", ephemeral=True)
@@ -192,11 +263,14 @@ async def adicionar_variacao(interaction, produto_id: int, nome: str, preco: flo
             try:
                 msg = await canal.fetch_message(prod['mensagem_id'])
                 await msg.edit(view=ProdutoView(produto_id, True))
+                if produto_id in catalogo:
+                    catalogo[produto_id]["tem_var"] = True
             except:
                 pass
     await interaction.response.send_message(f"✅ Variação '{nome}' adicionada.", ephemeral=True)
 
 @tree.command(name="pedidos", description="ADM")
+@rastrear
 async def pedidos(interaction):
     if not is_admin(interaction):
         return await interaction.response.send_message("Permissão negada.", ephemeral=True)
@@ -222,16 +296,19 @@ async def pedidos(interaction):
             self.pedidos = p
             self.idx = 0
         @discord.ui.button(label="◀", style=discord.ButtonStyle.blurple)
+        @rastrear
         async def ant(self, i, b):
             if not is_admin(i): return await i.response.send_message("Não", ephemeral=True)
             self.idx = (self.idx - 1) % total
             await i.response.edit_message(embed=embed_pedido(self.idx), view=self)
         @discord.ui.button(label="▶", style=discord.ButtonStyle.blurple)
+        @rastrear
         async def prox(self, i, b):
             if not is_admin(i): return await i.response.send_message("Não", ephemeral=True)
             self.idx = (self.idx + 1) % total
             await i.response.edit_message(embed=embed_pedido(self.idx), view=self)
         @discord.ui.button(label="✅ Confirmar", style=discord.ButtonStyle.success)
+        @rastrear
         async def conf(self, i, b):
             if not is_admin(i): return await i.response.send_message("Não", ephemeral=True)
             p = self.pedidos[self.idx]
@@ -260,6 +337,7 @@ async def pedidos(interaction):
                 self.idx = min(self.idx, len(self.pedidos)-1)
                 await i.edit_original_response(embed=embed_pedido(self.idx), view=self)
         @discord.ui.button(label="❌ Cancelar", style=discord.ButtonStyle.danger)
+        @rastrear
         async def canc(self, i, b):
             if not is_admin(i): return await i.response.send_message("Não", ephemeral=True)
             p = self.pedidos[self.idx]
@@ -279,6 +357,7 @@ async def pedidos(interaction):
     await interaction.response.send_message(embed=embed_pedido(0), view=PedidosView(lista))
 
 @tree.command(name="dashboard", description="ADM")
+@rastrear
 async def dashboard(interaction):
     if not is_admin(interaction): return await interaction.response.send_message("Não.", ephemeral=True)
     total_pagos = supabase.table("orders").select("id", count="exact").eq("status", "paid").execute().count
@@ -294,6 +373,7 @@ async def dashboard(interaction):
     await interaction.response.send_message(embed=embed)
 
 @tree.command(name="remover_produto", description="ADM")
+@rastrear
 async def remover_produto(interaction, produto_id: int):
     if not is_admin(interaction): return await interaction.response.send_message("Não.", ephemeral=True)
     prod = supabase.table("products").select("*").eq("id", produto_id).execute().data
@@ -308,350 +388,145 @@ async def remover_produto(interaction, produto_id: int):
             except:
                 pass
     supabase.table("products").delete().eq("id", produto_id).execute()
+    catalogo.pop(produto_id, None)
     await interaction.response.send_message(f"✅ Produto {produto_id} removido.", ephemeral=True)
 
-@bot.event
-async def on_ready():
-    await tree.sync()
-    print(f"✅ Bot logado como {bot.user}")
-    prods = supabase.table("products").select("*").execute().data
-    for p in prods:
-        if p['mensagem_id'] and p['canal_id']:
-            canal = bot.get_channel(p['canal_id'])
+def carregar_snapshot():
+    try:
+        with open(SNAPSHOT_PATH, "rb") as f:
+            snap = pickle.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        print(f"⚠️ Snapshot ignorado: {e}")
+        return False
+    if not isinstance(snap, dict) or snap.get("versao") != SNAPSHOT_VERSAO:
+        print("⚠️ Snapshot com versão incompatível, ignorado.")
+        return False
+    catalogo.update(snap["catalogo"])
+    pedidos_interrompidos.extend(snap["pendentes"])
+    for pid, info in catalogo.items():
+        bot.add_view(ProdutoView(pid, info["tem_var"]), message_id=info["mensagem_id"])
+    print(f"📦 Snapshot de {snap['salvo_em']} carregado: {len(catalogo)} produtos, {len(pedidos_interrompidos)} pedidos interrompidos")
+    return True
+
+def salvar_snapshot():
+    snap = {
+        "versao": SNAPSHOT_VERSAO,
+        "salvo_em": datetime.datetime.utcnow().isoformat(),
+        "catalogo": catalogo,
+        "pendentes": pedidos_interrompidos + list(pedidos_em_criacao.values())
+    }
+    tmp = f"{SNAPSHOT_PATH}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, SNAPSHOT_PATH)
+    except Exception as e:
+        print(f"⚠️ Falha ao salvar snapshot: {e}")
+        return
+    print(f"💾 Snapshot salvo: {len(catalogo)} produtos, {len(snap['pendentes'])} pedidos pendentes")
+
+async def reconciliar():
+    frio = not catalogo
+    prods = supabase.table("products").select("id, mensagem_id, canal_id").execute().data
+    com_var = {v['product_id'] for v in supabase.table("product_variations").select("product_id").execute().data}
+    atual = {p['id']: {"mensagem_id": p['mensagem_id'], "canal_id": p['canal_id'], "tem_var": p['id'] in com_var} for p in prods if p['mensagem_id'] and p['canal_id']}
+    for pid, info in atual.items():
+        antigo = catalogo.get(pid)
+        if antigo == info:
+            continue
+        bot.add_view(ProdutoView(pid, info["tem_var"]), message_id=info["mensagem_id"])
+        if frio or (antigo and antigo["tem_var"] != info["tem_var"]):
+            canal = bot.get_channel(info["canal_id"])
             if canal:
                 try:
-                    msg = await canal.fetch_message(p['mensagem_id'])
-                    tem_var = supabase.table("product_variations").select("id", count="exact").eq("product_id", p['id']).execute().count > 0
-                    await msg.edit(view=ProdutoView(p['id'], tem_var))
-                except:
+                    msg = await canal.fetch_message(info["mensagem_id"])
+                    await msg.edit(view=ProdutoView(pid, info["tem_var"]))
+                except Exception:
                     pass
-
-if __name__ == "__main__":
-    bot.run(TOKEN)            return
-
-        thread = await categoria.create_thread(
-            name=f"pedido-{interaction.user.name[:20]}-{produto_id}",
-            type=discord.ChannelType.private_thread
-        )
-        await thread.add_user(interaction.user)
-
-        data = {
-            "user_id": str(interaction.user.id),
-            "product_id": produto_id,
-            "variation_id": variacao['id'],
-            "amount": valor,
-            "status": "pending",
-            "payment_id": txid,
-            "thread_id": thread.id,
-            "cargo_entregue": False
-        }
-        supabase.table("orders").insert(data).execute()
-
-        embed_pedido = discord.Embed(
-            title="🛒 Pedido Realizado",
-            description=f"Produto: **{produto['nome']}**\nVariação: **{variacao['nome']}**\nValor: **R$ {valor:.2f}**",
-            color=discord.Color.from_str(produto['cor_embed'])
-        )
-        embed_pedido.add_field(name="Chave Pix (copia e cola)", value=f"```{payload_pix}```", inline=False)
-        embed_pedido.add_field(name="Instruções", value="Realize o pagamento via Pix. Após a confirmação você receberá seu cargo e instruções.", inline=False)
-        await thread.send(content=f"{interaction.user.mention}", embed=embed_pedido)
-
-        log_channel = bot.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            embed_log = discord.Embed(
-                title="🆕 Novo Pedido",
-                description=f"**Cliente:** {interaction.user.mention}\n**Produto:** {produto['nome']}\n**Variação:** {variacao['nome']}\n**Valor:** R$ {valor:.2f}",
-                color=discord.Color.blue(),
-                timestamp=datetime.datetime.utcnow()
-            )
-            await log_channel.send(embed=embed_log)
-
-        await interaction.followup.send(f"✅ Pedido criado! Acompanhe em {thread.mention}", ephemeral=True)
-
-class ComprarSemVariacaoButton(Button):
-    def __init__(self, produto_id: int):
-        super().__init__(label="💳 Comprar", style=discord.ButtonStyle.success, custom_id=f"buy_{produto_id}")
-
-    async def callback(self, interaction: discord.Interaction):
-        produto = supabase.table("products").select("*").eq("id", self.produto_id).execute().data[0]
-        if not produto:
-            await interaction.response.send_message("Produto não encontrado.", ephemeral=True)
-            return
-
-        valor = produto['preco']
-        txid = f"{interaction.user.id}_{datetime.datetime.utcnow().timestamp()}"
-        payload_pix = gerar_pix_payload(valor, txid)
-
-        await interaction.response.defer(ephemeral=True)
-
-        categoria = bot.get_channel(CART_CATEGORY_ID)
-        if not categoria:
-            await interaction.followup.send("Erro: categoria de carrinhos não encontrada.", ephemeral=True)
-            return
-
-        thread = await categoria.create_thread(
-            name=f"pedido-{interaction.user.name[:20]}-{self.produto_id}",
-            type=discord.ChannelType.private_thread
-        )
-        await thread.add_user(interaction.user)
-
-        data = {
-            "user_id": str(interaction.user.id),
-            "product_id": self.produto_id,
-            "variation_id": None,
-            "amount": valor,
-            "status": "pending",
-            "payment_id": txid,
-            "thread_id": thread.id,
-            "cargo_entregue": False
-        }
-        supabase.table("orders").insert(data).execute()
-
-        embed_pedido = discord.Embed(
-            title="🛒 Pedido Realizado",
-            description=f"Produto: **{produto['nome']}**\nValor: **R$ {valor:.2f}**",
-            color=discord.Color.from_str(produto['cor_embed'])
-        )
-        embed_pedido.add_field(name="Chave Pix (copia e cola)", value=f"```{payload_pix}```", inline=False)
-        embed_pedido.add_field(name="Instruções", value="Realize o pagamento via Pix. Após a confirmação você receberá seu cargo e instruções.", inline=False)
-        await thread.send(content=f"{interaction.user.mention}", embed=embed_pedido)
-
-        log_channel = bot.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            embed_log = discord.Embed(
-                title="🆕 Novo Pedido",
-                description=f"**Cliente:** {interaction.user.mention}\n**Produto:** {produto['nome']}\n**Valor:** R$ {valor:.2f}",
-                color=discord.Color.blue(),
-                timestamp=datetime.datetime.utcnow()
-            )
-            await log_channel.send(embed=embed_log)
-
-        await interaction.followup.send(f"✅ Pedido criado! Acompanhe em {thread.mention}", ephemeral=True)
-
-@tree.command(name="criar_produto", description="[ADMIN] Cria um novo produto com embed no canal atual.")
-@app_commands.describe(
-    nome="Nome do produto",
-    descricao="Descrição detalhada",
-    preco="Preço (se não tiver variações, coloque o valor; se tiver variações, coloque 0)",
-    cargo_id="ID do cargo entregue",
-    thumbnail_url="URL da imagem pequena (canto superior)",
-    banner_url="URL da imagem grande (centro)"
-)
-async def criar_produto(
-    interaction: discord.Interaction,
-    nome: str,
-    descricao: str,
-    preco: float,
-    cargo_id: str,
-    thumbnail_url: str,
-    banner_url: str
-):
-    if not is_admin(interaction):
-        return await interaction.response.send_message("Permissão negada.", ephemeral=True)
-
-    data = {
-        "nome": nome,
-        "descricao": descricao,
-        "preco": None if preco == 0 else preco,
-        "cargo_id": int(cargo_id),
-        "cor_embed": "#ffffff",
-        "thumbnail_url": thumbnail_url,
-        "banner_url": banner_url,
-        "canal_id": interaction.channel_id,
-        "mensagem_id": None
-    }
-    result = supabase.table("products").insert(data).execute()
-    produto_id = result.data[0]['id']
-
-    embed = discord.Embed(
-        title=nome,
-        description=descricao,
-        color=discord.Color.from_str("#ffffff")
-    )
-    if preco and preco > 0:
-        embed.add_field(name="Preço", value=f"R$ {preco:.2f}", inline=False)
-    embed.set_thumbnail(url=thumbnail_url)
-    embed.set_image(url=banner_url)
-
-    tem_variacoes = (preco == 0)
-    view = ProdutoView(produto_id, tem_variacoes)
-
-    msg = await interaction.channel.send(embed=embed, view=view)
-    supabase.table("products").update({"mensagem_id": msg.id}).eq("id", produto_id).execute()
-
-    await interaction.response.send_message(f"✅ Produto criado! ID: {produto_id}", ephemeral=True)
-
-@tree.command(name="adicionar_variacao", description="[ADMIN] Adiciona uma variação a um produto existente.")
-@app_commands.describe(
-    produto_id="ID do produto",
-    nome="Nome da variação (ex: 3 dias)",
-    preco="Preço da variação",
-    cargo_id="ID do cargo (opcional, se diferente do produto)"
-)
-async def adicionar_variacao(
-    interaction: discord.Interaction,
-    produto_id: int,
-    nome: str,
-    preco: float,
-    cargo_id: Optional[str] = None
-):
-    if not is_admin(interaction):
-        return await interaction.response.send_message("Permissão negada.", ephemeral=True)
-
-    data = {
-        "product_id": produto_id,
-        "nome": nome,
-        "preco": preco,
-        "cargo_id": int(cargo_id) if cargo_id else None
-    }
-    supabase.table("product_variations").insert(data).execute()
-
-    produto = supabase.table("products").select("*").eq("id", produto_id).execute().data[0]
-    if produto['mensagem_id'] and produto['canal_id']:
-        canal = bot.get_channel(produto['canal_id'])
-        if canal:
+    catalogo.clear()
+    catalogo.update(atual)
+    if pedidos_interrompidos:
+        txids = [p['txid'] for p in pedidos_interrompidos]
+        existentes = {o['payment_id'] for o in supabase.table("orders").select("payment_id").in_("payment_id", txids).execute().data}
+        log = bot.get_channel(LOG_CHANNEL_ID)
+        for p in list(pedidos_interrompidos):
             try:
-                msg = await canal.fetch_message(produto['mensagem_id'])
-                embed = msg.embeds[0]
-                view = ProdutoView(produto_id, tem_variacoes=True)
-                await msg.edit(embed=embed, view=view)
-            except:
-                pass
-
-    await interaction.response.send_message(f"✅ Variação '{nome}' adicionada ao produto {produto_id}.", ephemeral=True)
-
-@tree.command(name="pedidos", description="[ADMIN] Lista pedidos pendentes.")
-async def pedidos(interaction: discord.Interaction):
-    if not is_admin(interaction):
-        return await interaction.response.send_message("Permissão negada.", ephemeral=True)
-
-    pedidos = supabase.table("orders").select("*, products(nome), product_variations(nome)").eq("status", "pending").order("criado_em", desc=True).execute().data
-    if not pedidos:
-        return await interaction.response.send_message("Nenhum pedido pendente.", ephemeral=True)
-
-    total = len(pedidos)
-
-    def embed_pedido(index):
-        p = pedidos[index]
-        embed = discord.Embed(title=f"Pedido #{p['id']}", color=discord.Color.orange())
-        embed.add_field(name="Cliente", value=f"<@{p['user_id']}>", inline=True)
-        embed.add_field(name="Produto", value=p['products']['nome'], inline=True)
-        if p['variation_id']:
-            embed.add_field(name="Variação", value=p['product_variations']['nome'], inline=True)
-        embed.add_field(name="Valor", value=f"R$ {p['amount']:.2f}", inline=True)
-        embed.add_field(name="Status", value=p['status'], inline=True)
-        embed.add_field(name="Data", value=p['criado_em'][:10], inline=True)
-        embed.set_footer(text=f"Página {index+1} de {total}")
-        return embed
-
-    class PedidosView(View):
-        def __init__(self, pedidos_list):
-            super().__init__(timeout=180)
-            self.pedidos = pedidos_list
-            self.index = 0
-
-        @discord.ui.button(label="◀", style=discord.ButtonStyle.blurple)
-        async def anterior(self, i: discord.Interaction, b: discord.ui.Button):
-            if not is_admin(i):
-                return await i.response.send_message("Permissão negada.", ephemeral=True)
-            self.index = (self.index - 1) % total
-            await i.response.edit_message(embed=embed_pedido(self.index), view=self)
-
-        @discord.ui.button(label="▶", style=discord.ButtonStyle.blurple)
-        async def proximo(self, i: discord.Interaction, b: discord.ui.Button):
-            if not is_admin(i):
-                return await i.response.send_message("Permissão negada.", ephemeral=True)
-            self.index = (self.index + 1) % total
-            await i.response.edit_message(embed=embed_pedido(self.index), view=self)
-
-        @discord.ui.button(label="✅ Confirmar Pagamento", style=discord.ButtonStyle.success)
-        async def confirmar(self, i: discord.Interaction, b: discord.ui.Button):
-            if not is_admin(i):
-                return await i.response.send_message("Permissão negada.", ephemeral=True)
-            p = self.pedidos[self.index]
-            supabase.table("orders").update({"status": "paid"}).eq("id", p['id']).execute()
-
-            guild = i.guild
-            member = guild.get_member(int(p['user_id']))
-            if member:
-                if p['variation_id']:
-                    var = supabase.table("product_variations").select("cargo_id").eq("id", p['variation_id']).execute().data[0]
-                    cargo_id = var['cargo_id'] or supabase.table("products").select("cargo_id").eq("id", p['product_id']).execute().data[0]['cargo_id']
-                else:
-                    cargo_id = supabase.table("products").select("cargo_id").eq("id", p['product_id']).execute().data[0]['cargo_id']
-                role = guild.get_role(int(cargo_id))
-                if role:
-                    await member.add_roles(role)
-                    supabase.table("orders").update({"cargo_entregue": True}).eq("id", p['id']).execute()
-
-            if p['thread_id']:
-                thread = bot.get_channel(int(p['thread_id']))
-                if thread:
-                    await thread.send(f"✅ **Pagamento confirmado!**\n{MENSAGEM_POS_CONFIRMACAO}")
-                    await thread.edit(archived=True, locked=True)
-
-            await i.response.send_message(f"Pedido #{p['id']} confirmado e cargo entregue.", ephemeral=True)
-            self.pedidos.pop(self.index)
-            if not self.pedidos:
-                await i.edit_original_response(content="Nenhum pedido pendente.", embed=None, view=None)
-            else:
-                self.index = min(self.index, len(self.pedidos)-1)
-                await i.edit_original_response(embed=embed_pedido(self.index), view=self)
-
-        @discord.ui.button(label="❌ Cancelar Pedido", style=discord.ButtonStyle.danger)
-        async def cancelar(self, i: discord.Interaction, b: discord.ui.Button):
-            if not is_admin(i):
-                return await i.response.send_message("Permissão negada.", ephemeral=True)
-            p = self.pedidos[self.index]
-            supabase.table("orders").update({"status": "cancelled"}).eq("id", p['id']).execute()
-            if p['thread_id']:
-                thread = bot.get_channel(int(p['thread_id']))
-                if thread:
-                    await thread.send("❌ Pedido cancelado.")
-                    await thread.edit(archived=True, locked=True)
-            await i.response.send_message(f"Pedido #{p['id']} cancelado.", ephemeral=True)
-            self.pedidos.pop(self.index)
-            if not self.pedidos:
-                await i.edit_original_response(content="Nenhum pedido pendente.", embed=None, view=None)
-            else:
-                self.index = min(self.index, len(self.pedidos)-1)
-                await i.edit_original_response(embed=embed_pedido(self.index), view=self)
-
-    await interaction.response.send_message(embed=embed_pedido(0), view=PedidosView(pedidos))
-
-@tree.command(name="dashboard", description="[ADMIN] Métricas de vendas.")
-async def dashboard(interaction: discord.Interaction):
-    if not is_admin(interaction):
-        return await interaction.response.send_message("Permissão negada.", ephemeral=True)
-
-    total_pedidos = supabase.table("orders").select("id", count="exact").eq("status", "paid").execute().count
-    paid_orders = supabase.table("orders").select("amount").eq("status", "paid").execute().data
-    faturamento_total = sum(o['amount'] for o in paid_orders)
-    hoje = datetime.date.today().isoformat()
-    paid_hoje = supabase.table("orders").select("amount").eq("status", "paid").gte("criado_em", f"{hoje}T00:00:00").execute().data
-    faturamento_hoje = sum(o['amount'] for o in paid_hoje)
+                await retomar_pedido(p, p['txid'] in existentes, log)
+            except Exception as e:
+                print(f"⚠️ Falha ao retomar pedido {p['txid']}: {e}")
+                continue
+            pedidos_interrompidos.remove(p)
+    salvar_snapshot()
+
+async def obter_canal(canal_id):
+    return bot.get_channel(canal_id) or await bot.fetch_channel(canal_id)
+
+async def retomar_pedido(p, existe, log):
+    if not log:
+        raise RuntimeError("canal de log indisponível")
+    if not existe:
+        if p['thread_id']:
+            try:
+                thread = await obter_canal(p['thread_id'])
+            except discord.NotFound:
+                thread = None
+            if thread:
+                await thread.send("❌ Cancelado.")
+                await thread.edit(archived=True, locked=True)
+        await log.send(embed=discord.Embed(title="⚠️ Pedido interrompido", description=f"<@{p['user_id']}>\n{p['descricao']}\nO bot reiniciou durante a criação deste pedido.", color=discord.Color.red(), timestamp=datetime.datetime.utcnow()))
+        return
+    if not p['pix_enviado']:
+        thread = await obter_canal(p['thread_id'])
+        embed = discord.Embed(title="🛒 Pedido", description=p['descricao'], color=discord.Color.from_str(p['cor']))
+        embed.add_field(name="Pix", value=f"```{gerar_pix_payload(p['amount'], p['txid'])}```", inline=False)
+        await thread.send(content=f"<@{p['user_id']}>", embed=embed)
+        p['pix_enviado'] = True
+    if not p['log_enviado']:
+        await log.send(embed=discord.Embed(title="🆕 Pedido", description=f"<@{p['user_id']}>\n{p['descricao']}", color=discord.Color.blue(), timestamp=datetime.datetime.utcnow()))
+        p['log_enviado'] = True
+
+async def encerrar(sig):
+    global encerrando
+    if encerrando:
+        return
+    encerrando = True
+    print(f"🛑 {sig.name} recebido, finalizando {len(tarefas_ativas)} interações e {len(tarefas_fundo)} tarefas...")
+    pendentes = tarefas_ativas | tarefas_fundo
+    if pendentes:
+        # Snapshot preliminar caso a plataforma mate o processo durante a espera
+        salvar_snapshot()
+        _, pendentes = await asyncio.wait(pendentes, timeout=SHUTDOWN_TIMEOUT)
+        for t in pendentes:
+            t.cancel()
+        if pendentes:
+            await asyncio.wait(pendentes, timeout=1)
+    salvar_snapshot()
+    await bot.close()
+
+def agendar_encerramento(sig):
+    global tarefa_encerramento
+    if tarefa_encerramento is None:
+        tarefa_encerramento = asyncio.create_task(encerrar(sig))
 
-    embed = discord.Embed(title="📊 Dashboard de Vendas", color=discord.Color.green())
-    embed.add_field(name="Total de Pedidos Pagos", value=str(total_pedidos), inline=False)
-    embed.add_field(name="Faturamento Total", value=f"R$ {faturamento_total:.2f}", inline=False)
-    embed.add_field(name="Faturamento Hoje", value=f"R$ {faturamento_hoje:.2f}", inline=False)
-    await interaction.response.send_message(embed=embed)
+@bot.event
+async def setup_hook():
+    carregar_snapshot()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, agendar_encerramento, sig)
+        except NotImplementedError:
+            pass
 
-@tree.command(name="editar_produto", description="[ADMIN] Edita um produto existente (breve).")
-async def editar_produto(interaction: discord.Interaction, produto_id: int):
-    await interaction.response.send_message("Em desenvolvimento. Use o SQL por enquanto.", ephemeral=True)
+@bot.event
+async def on_ready():
+    global tarefa_reconciliacao
+    await tree.sync()
+    print(f"✅ Bot logado como {bot.user} ({time.perf_counter() - INICIO:.2f}s após o start)")
+    if tarefa_reconciliacao is None or tarefa_reconciliacao.done():
+        tarefa_reconciliacao = em_fundo(reconciliar())
 
-@tree.command(name="remover_produto", description="[ADMIN] Remove um produto e sua mensagem.")
-@app_commands.describe(produto_id="ID do produto")
-async def remover_produto(interaction: discord.Interaction, produto_id: int):
-    if not is_admin(interaction):
-        return await interaction.response.send_message("Permissão negada.", ephemeral=True)
-    produto = supabase.table("products").select("*").eq("id", produto_id).execute().data
-    if not produto:
-        return await interaction.response.send_message("Produto não encontrado.", ephemeral=True)
-    p = produto[0]
-    if p['mensagem_id'] and p['canal_id']:
-        canal = bot.get_channel(p['canal_id'])
-        if canal:
-            try:
-                msg = await canal.fet
+if __name__ == "__main__":
+    bot.run(TOKEN)